@@ -7,14 +7,36 @@
 # - Optional GitHub CSV sync (via st.secrets["github_store"])
 
 import os
+import re
+import csv
 import base64
 import hashlib
+import hmac
+import mmap
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date, time
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # optional: faster CSV reads (ships with Streamlit)
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pacsv = None
+
+try:  # POSIX only; elsewhere writes go unlocked
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # ===============================
 # Streamlit config
@@ -33,6 +55,12 @@ STUDENT_CSV = os.path.join(DATA_DIR, "Student_records.csv")
 BOOKS_CSV   = os.path.join(DATA_DIR, "Library_books.csv")
 LOG_CSV     = os.path.join(DATA_DIR, "Borrow_log.csv")
 
+LOG_COLS = ["Student", "Book Title", "Book ID", "Barcode", "Copy Key", "Date Borrowed", "Due Date", "Returned"]
+TS_FMT = "%Y-%m-%d %H:%M:%S"  # how the app writes Date Borrowed / Due Date
+
+# Opt-in: LIBRARY_FAST_CSV=1 reads the data CSVs with pyarrow's parser
+FAST_CSV = pacsv is not None and os.environ.get("LIBRARY_FAST_CSV", "") == "1"
+
 # ===============================
 # Session init
 # ===============================
@@ -44,17 +72,25 @@ if "username" not in st.session_state:
 # ===============================
 # Auth
 # ===============================
-def hash_password(p: str) -> str:
-    return hashlib.sha256(p.encode()).hexdigest()
+def hash_password(p: str, salt: bytes) -> bytes:
+    # scrypt (16 MiB, ~50 ms per call)
+    return hashlib.scrypt(p.encode(), salt=salt, n=2**14, r=8, p=1, dklen=32)
 
+# (salt, scrypt digest), stored precomputed (the script re-executes on every rerun).
+# New entry: salt = os.urandom(16); (salt.hex(), hash_password("<password>", salt).hex())
 USERS = {
-    "admin":   hash_password("admin123"),
-    "teacher": hash_password("tzuchi2025"),
+    "admin":   (bytes.fromhex("5986213bf86d9b953ec022d0d9fafc75"),
+                bytes.fromhex("88176b8c0bf2857e55e4ac9bf87aab11d525e4c0f9b1ea4f2171a25d8261a79d")),
+    "teacher": (bytes.fromhex("577734bf19828ed2d2a1f877d6b83dc3"),
+                bytes.fromhex("344934669b397cb156cf13377798a3fefd7fbf4097f57ecb033522b6cab1a929")),
 }
+_NO_USER = (b"\0" * 16, b"")  # unknown names still pay for one KDF
 
 def verify_login(username: str, password: str) -> bool:
-    u = (username or "").strip().lower()
-    return USERS.get(u) == hash_password(password or "")
+    stored = USERS.get((username or "").strip().lower())
+    salt, digest = stored or _NO_USER
+    ok = hmac.compare_digest(digest, hash_password(password or "", salt))
+    return stored is not None and ok
 
 def is_admin() -> bool:
     return (st.session_state.get("username") or "").strip().lower() == "admin"
@@ -81,16 +117,56 @@ def _canon(s: str) -> str:
         return ""
     return "".join(ch for ch in str(s) if ch.isalnum()).upper()
 
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+def _canon_series(s: pd.Series) -> pd.Series:
+    """_canon for a whole column in two vectorized string ops.
+
+    Same result for ASCII codes and barcodes; only letters with a multi-character uppercase (ß) differ.
+    """
+    return s.str.replace(_NON_ALNUM, "", regex=True).str.upper()
+
+def _match_rows(df: pd.DataFrame, rows: pd.DataFrame, key_cols: list) -> pd.Series:
+    """rows' labels -> labels of the same rows in df, matched on key_cols (n-th duplicate to n-th).
+
+    Rows with no match in df (changed or removed since they were loaded) are left out.
+    """
+    ours = rows[key_cols].astype(str).assign(_n=lambda d: d.groupby(key_cols, sort=False).cumcount())
+    theirs = df[key_cols].astype(str).assign(_n=lambda d: d.groupby(key_cols, sort=False).cumcount())
+    m = ours.reset_index(names="_ours").merge(theirs.reset_index(names="_theirs"), on=key_cols + ["_n"])
+    return pd.Series(m["_theirs"].to_numpy(), index=m["_ours"].to_numpy())
+
 def df_append(df: pd.DataFrame, row_dict: dict) -> pd.DataFrame:
-    return pd.concat([df, pd.DataFrame([row_dict])], ignore_index=True)
+    """Append one row in place via .loc enlargement."""
+    for c in row_dict:
+        if c not in df.columns:
+            df[c] = ""
+    df.loc[df.index.max() + 1 if len(df) else 0] = row_dict
+    return df
+
+def _parse_ts(s: pd.Series) -> pd.Series:
+    """Parse timestamps with TS_FMT; only cells in another (hand-edited) format go through inference."""
+    out = pd.to_datetime(s, format=TS_FMT, errors="coerce")
+    odd = out.isna() & s.ne("")
+    if odd.any():
+        out[odd] = pd.to_datetime(s[odd], format="mixed", errors="coerce")
+    return out
 
 def _file_rowcount(path: str) -> int:
+    """Data lines after the header, counted on raw bytes (no CSV parse)."""
     if not os.path.exists(path):
         return 0
+    lines, last = 0, b"\n"
     try:
-        return len(pd.read_csv(path, dtype=str))
-    except Exception:
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                lines += chunk.count(b"\n")
+                last = chunk[-1:]
+    except OSError:
         return 0
+    if last != b"\n":  # final line without a trailing newline
+        lines += 1
+    return max(0, lines - 1)
 
 # ===============================
 # Optional GitHub sync
@@ -110,27 +186,84 @@ def _gh_paths():
     _, repo, branch, base_path = _gh_conf()
     return repo, branch, base_path
 
+# Shared across sessions: one HTTP session, one push worker (pushes in order), one SHA cache
+@st.cache_resource(show_spinner=False)
+def _gh_session() -> requests.Session:
+    s = requests.Session()
+    # retry reads on dropped connections and transient 5xx
+    retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods={"GET"})
+    s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry))
+    return s
+
+@st.cache_resource(show_spinner=False)
+def _gh_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="gh-push")
+
+@st.cache_resource(show_spinner=False)
+def _gh_sha_cache() -> dict:
+    return {}
+
+# past this age a cached SHA is refetched rather than trusted (edits made on github.com)
+GH_SHA_TTL = timedelta(minutes=5)
+# while pushes are queued, the sidebar checks on them this often
+GH_POLL_EVERY = timedelta(seconds=5)
+
+@st.cache_resource(show_spinner=False)
+def _gh_etag_cache() -> dict:
+    return {}
+
+def _gh_get(url, timeout):
+    """Conditional GET: an unchanged resource comes back as a bodyless 304 and the last 200 is reused."""
+    cache = _gh_etag_cache()
+    headers = _gh_headers()
+    hit = cache.get(url)
+    if hit:
+        headers["If-None-Match"] = hit[0]
+    r = _gh_session().get(url, headers=headers, timeout=timeout)
+    if r.status_code == 304 and hit:
+        return hit[1]
+    if r.status_code == 200 and r.headers.get("ETag"):
+        cache[url] = (r.headers["ETag"], r)
+    return r
+
 def _gh_get_sha(repo, branch, path):
     url = f"https://api.github.com/repos/{repo}/contents/{path}?ref={branch}"
-    r = requests.get(url, headers=_gh_headers(), timeout=20)
+    r = _gh_get(url, timeout=20)
     if r.status_code == 200:
         return r.json().get("sha")
     return None
 
-def _gh_put_file(repo, branch, path, content_bytes, message):
+def _gh_put_file(repo, branch, path, content_b64, message):
     url = f"https://api.github.com/repos/{repo}/contents/{path}"
-    sha = _gh_get_sha(repo, branch, path)
+    # blob SHA from our last PUT
+    sha_cache = _gh_sha_cache()
+    key = (repo, branch, path)
     payload = {
         "message": message,
         "branch": branch,
-        "content": base64.b64encode(content_bytes).decode("utf-8"),
+        "content": content_b64,
         "committer": {"name": "Streamlit Bot", "email": "actions@users.noreply.github.com"},
     }
-    if sha:
-        payload["sha"] = sha
 
-    r = requests.put(url, headers=_gh_headers(), json=payload, timeout=30)
+    for attempt in range(2):
+        sha = None
+        cached = sha_cache.get(key) if attempt == 0 else None
+        if cached and datetime.now() - cached[1] < GH_SHA_TTL:
+            sha = cached[0]
+        sha = sha or _gh_get_sha(repo, branch, path)
+        if sha:
+            payload["sha"] = sha
+        else:
+            payload.pop("sha", None)
+        r = _gh_session().put(url, headers=_gh_headers(), json=payload, timeout=30)
+        # 409/422: the file moved on; refetch the SHA once
+        if r.status_code in (409, 422) and attempt == 0:
+            sha_cache.pop(key, None)
+            continue
+        break
+
     if r.status_code not in (200, 201):
+        sha_cache.pop(key, None)
         try:
             body = r.json()
             msg = body.get("message", "")
@@ -140,15 +273,122 @@ def _gh_put_file(repo, branch, path, content_bytes, message):
         raise RuntimeError(
             f"GitHub save failed ({r.status_code}). Repo='{repo}', branch='{branch}', path='{path}'. {msg} {doc}"
         )
-    return r.json()
+    body = r.json()
+    new_sha = (body.get("content") or {}).get("sha")
+    if new_sha:
+        sha_cache[key] = (new_sha, datetime.now())
+    return body
+
+_GH_COMMIT_MUTATION = """
+mutation($input: CreateCommitOnBranchInput!) {
+  createCommitOnBranch(input: $input) { commit { oid } }
+}
+"""
+
+def _gh_put_many(repo, branch, files, message):
+    """Commit several files as one commit through GraphQL createCommitOnBranch."""
+    variables = {"input": {
+        "branch": {"repositoryNameWithOwner": repo, "branchName": branch},
+        "message": {"headline": message},
+        "fileChanges": {"additions": [
+            {"path": path, "contents": content_b64} for path, content_b64 in files
+        ]},
+    }}
+    head_url = f"https://api.github.com/repos/{repo}/branches/{branch}"
+
+    for attempt in range(2):
+        rb = _gh_get(head_url, timeout=20)
+        if rb.status_code != 200:
+            raise RuntimeError(f"GitHub save failed ({rb.status_code}). Repo='{repo}', branch='{branch}' not readable.")
+        variables["input"]["expectedHeadOid"] = rb.json()["commit"]["sha"]
+        r = _gh_session().post("https://api.github.com/graphql", headers=_gh_headers(),
+                               json={"query": _GH_COMMIT_MUTATION, "variables": variables}, timeout=30)
+        try:
+            errors = r.json().get("errors") if r.status_code == 200 else None
+        except Exception:
+            errors = [{"message": r.text}]
+        # the head may have moved since we read it; reread it once
+        if errors and attempt == 0:
+            continue
+        break
+
+    # cached SHAs of these paths are stale now
+    sha_cache = _gh_sha_cache()
+    for path, _ in files:
+        sha_cache.pop((repo, branch, path), None)
+
+    if r.status_code != 200 or errors:
+        msg = "; ".join(e.get("message", "") for e in errors) if errors else r.text
+        paths = ", ".join(path for path, _ in files)
+        raise RuntimeError(
+            f"GitHub save failed ({r.status_code}). Repo='{repo}', branch='{branch}', paths='{paths}'. {msg}"
+        )
+    return r.json()["data"]["createCommitOnBranch"]["commit"]
+
+def _gh_submit(fn, *args):
+    fut = _gh_pool().submit(fn, *args)
+    st.session_state.setdefault("gh_pending", []).append(fut)
+    return fut
 
 def _gh_put_csv(local_path, repo_rel_path, message):
-    with open(local_path, "rb") as f:
-        csv_bytes = f.read()
+    """Queue a push of the file as it is now; _gh_report_pending reports the outcome."""
+    # base64 snapshot of the file
+    with open(local_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        csv_b64 = base64.b64encode(mm).decode("ascii")
     repo, branch, base_path = _gh_paths()
     path = f"{base_path}/{repo_rel_path}".lstrip("/")
-    return _gh_put_file(repo, branch, path, csv_bytes, message)
-
+    batch = st.session_state.get("gh_batch")
+    if batch is not None:
+        batch[path] = csv_b64  # pushed by _gh_batch on exit; a later save of the same file wins
+        return None
+    return _gh_submit(_gh_put_file, repo, branch, path, csv_b64, message)
+
+@contextmanager
+def _gh_batch():
+    """Saves made inside are pushed together as one commit when the block ends."""
+    st.session_state["gh_batch"] = {}
+    try:
+        yield
+    finally:
+        batch = st.session_state.pop("gh_batch")
+        if batch:
+            try:
+                repo, branch, _ = _gh_paths()
+                message = f"Update {', '.join(os.path.basename(p) for p in batch)} via Streamlit app"
+                if len(batch) == 1:
+                    (path, content_b64), = batch.items()
+                    _gh_submit(_gh_put_file, repo, branch, path, content_b64, message)
+                else:
+                    _gh_submit(_gh_put_many, repo, branch, list(batch.items()), message)
+            except Exception as e:
+                st.error(f"GitHub sync failed: {e}")
+
+def _gh_report_pending():
+    """Report pushes that have finished; never waits on queued ones.
+
+    The last failure stays in session state for the sidebar until a later push succeeds.
+    """
+    pending = st.session_state.get("gh_pending", [])
+    for fut in [f for f in pending if f.done()]:
+        pending.remove(fut)
+        if fut.exception() is not None:
+            st.session_state["gh_failed"] = str(fut.exception())
+            st.error(f"GitHub sync failed: {fut.exception()}")
+        else:
+            st.session_state.pop("gh_failed", None)
+
+def _gh_sync_status():
+    """Sidebar sync state; run as a polling fragment while pushes are queued."""
+    _gh_report_pending()
+    n_pending = len(st.session_state.get("gh_pending", []))
+    if n_pending:
+        st.caption(f"⏳ Sync pending: **{n_pending}** push(es)")
+    if st.session_state.get("gh_failed"):
+        st.markdown("**Sync:** <span style='color:red'>last push failed</span>", unsafe_allow_html=True)
+        st.caption(st.session_state["gh_failed"])
+
+# probe result reused for a minute
+@st.cache_data(ttl=60, show_spinner=False)
 def _gh_self_test():
     if not _gh_enabled():
         return "GitHub OFF", "gray"
@@ -156,10 +396,10 @@ def _gh_self_test():
         token, repo, branch, base_path = _gh_conf()
         if not token or not repo:
             return "GitHub secrets incomplete", "red"
-        r = requests.get(f"https://api.github.com/repos/{repo}", headers=_gh_headers(), timeout=15)
+        r = _gh_get(f"https://api.github.com/repos/{repo}", timeout=15)
         if r.status_code != 200:
             return f"GH {r.status_code}: cannot see '{repo}'", "red"
-        rb = requests.get(f"https://api.github.com/repos/{repo}/branches/{branch}", headers=_gh_headers(), timeout=15)
+        rb = _gh_get(f"https://api.github.com/repos/{repo}/branches/{branch}", timeout=15)
         if rb.status_code != 200:
             return f"GH {rb.status_code}: branch '{branch}' missing", "red"
         return f"GitHub OK → {repo}@{branch}/{base_path}", "green"
@@ -175,16 +415,21 @@ def ensure_files():
     if not os.path.exists(BOOKS_CSV):
         pd.DataFrame(columns=["Book ID", "Book Title", "Author", "Status", "Barcode"]).to_csv(BOOKS_CSV, index=False, encoding="utf-8")
     if not os.path.exists(LOG_CSV):
-        pd.DataFrame(columns=["Student", "Book Title", "Book ID", "Barcode", "Copy Key", "Date Borrowed", "Due Date", "Returned"]).to_csv(
+        pd.DataFrame(columns=LOG_COLS).to_csv(
             LOG_CSV, index=False, encoding="utf-8"
         )
+    _migrate_legacy_files()
 
+# once per server process
+@st.cache_resource(show_spinner=False)
+def _migrate_legacy_files():
     # legacy (if user had old CSV in root)
     legacy_students = os.path.join(BASE_DIR, "Student_records.csv")
     legacy_books    = os.path.join(BASE_DIR, "Library_books.csv")
     legacy_logs     = os.path.join(BASE_DIR, "Borrow_log.csv")
 
-    if _file_rowcount(STUDENT_CSV) == 0 and os.path.exists(legacy_students):
+    # targets may be open in other sessions: swap them in via _write_csv
+    if os.path.exists(legacy_students) and _file_rowcount(STUDENT_CSV) == 0:
         try:
             df = pd.read_csv(legacy_students, dtype=str).fillna("")
             df = df.rename(columns={
@@ -194,40 +439,37 @@ def ensure_files():
                 "Student Code":"Code",
                 "ID":"Code"
             })
-            for c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
+            df = df.apply(lambda s: s.str.strip())
             for c in ["Code","Name","Surname","Gender"]:
                 if c not in df.columns:
                     df[c] = ""
-            df[["Code","Name","Surname","Gender"]].to_csv(STUDENT_CSV, index=False, encoding="utf-8")
+            _write_csv(df[["Code","Name","Surname","Gender"]], STUDENT_CSV)
         except Exception as e:
             st.warning(f"Could not migrate legacy students file: {e}")
 
-    if _file_rowcount(BOOKS_CSV) == 0 and os.path.exists(legacy_books):
+    if os.path.exists(legacy_books) and _file_rowcount(BOOKS_CSV) == 0:
         try:
             df = pd.read_csv(legacy_books, dtype=str).fillna("")
-            for c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
+            df = df.apply(lambda s: s.str.strip())
             if "Status" not in df.columns:
                 df["Status"] = "Available"
-            df.to_csv(BOOKS_CSV, index=False, encoding="utf-8")
+            _write_csv(df, BOOKS_CSV)
         except Exception as e:
             st.warning(f"Could not migrate legacy books file: {e}")
 
-    if _file_rowcount(LOG_CSV) == 0 and os.path.exists(legacy_logs):
+    if os.path.exists(legacy_logs) and _file_rowcount(LOG_CSV) == 0:
         try:
             df = pd.read_csv(legacy_logs, dtype=str, on_bad_lines="skip").fillna("")
-            for c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
+            df = df.apply(lambda s: s.str.strip())
             if "Returned" not in df.columns:
                 df["Returned"] = "No"
-            df.to_csv(LOG_CSV, index=False, encoding="utf-8")
+            _write_csv(df, LOG_CSV)
         except Exception as e:
             st.warning(f"Could not migrate legacy logs file: {e}")
 
 # ---------- books helpers ----------
 def _normalize_barcode_headers(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    df = df.copy(deep=False)  # own object for the column insert
     rename_barcode = {
         "Barcode/ISBN": "Barcode",
         "Barcode / ISBN": "Barcode",
@@ -245,7 +487,7 @@ def _normalize_barcode_headers(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 def _apply_book_helpers(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    df = df.copy(deep=False)  # own object for the header rewrite
     df.columns = df.columns.str.strip()
     df = _normalize_barcode_headers(df)
     df = df.loc[:, ~df.columns.str.match(r"^Unnamed")]
@@ -253,8 +495,8 @@ def _apply_book_helpers(df: pd.DataFrame) -> pd.DataFrame:
     if "Status" not in df.columns:
         df["Status"] = "Available"
 
-    for c in df.columns:
-        df[c] = df[c].astype(str).str.strip()
+    # editor output may hold non-str cells and a categorical Status
+    df = df.astype(str).apply(lambda s: s.str.strip())
 
     df["Status"] = (
         df["Status"].str.lower()
@@ -273,13 +515,13 @@ def _apply_book_helpers(df: pd.DataFrame) -> pd.DataFrame:
     except Exception:
         current_max = 0
 
-    need_uid = df["_ROW_UID"].astype(str).str.strip() == ""
+    need_uid = df["_ROW_UID"] == ""
     n = int(need_uid.sum())
     if n:
         new_vals = list(range(int(current_max) + 1, int(current_max) + 1 + n))
         df.loc[need_uid, "_ROW_UID"] = [str(v) for v in new_vals]
 
-    df["_BARCODE_CANON"] = df["Barcode"].map(_canon)
+    df["_BARCODE_CANON"] = _canon_series(df["Barcode"])
     df["_COPY_KEY"] = (
         df.get("Book ID", "").astype(str) + "|" +
         df["Barcode"].astype(str) + "|" +
@@ -288,16 +530,51 @@ def _apply_book_helpers(df: pd.DataFrame) -> pd.DataFrame:
 
     # remove empty rows (must have title or barcode)
     if "Book Title" in df.columns:
-        keep = (df["Book Title"].astype(str).str.strip() != "") | (df["Barcode"].astype(str).str.strip() != "")
-        df = df[keep].copy()
+        keep = (df["Book Title"] != "") | (df["Barcode"] != "")
+        df = df[keep]
 
     return df
 
 # ===============================
 # Load/Save
 # ===============================
-def load_students() -> pd.DataFrame:
-    df = pd.read_csv(STUDENT_CSV, dtype=str).fillna("")
+# Parsed frames are cached per file signature; load_* hand out shallow copies (copy-on-write)
+def _read_csv_str(path: str, skip_bad: bool = False) -> pd.DataFrame:
+    """Read every cell as a str, blanks as "" (pyarrow when FAST_CSV, else pandas' C parser)."""
+    if FAST_CSV:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f), [])
+        # blank/duplicate headers: leave the Unnamed/.1 renaming to pandas
+        if header and all(header) and len(set(header)) == len(header):
+            bad_rows = []
+
+            def _flag(row):
+                bad_rows.append(row.number)
+                return "skip"
+
+            try:
+                # explicit string types: pyarrow would otherwise infer "0001" as an int
+                table = pacsv.read_csv(
+                    path,
+                    parse_options=pacsv.ParseOptions(newlines_in_values=True, invalid_row_handler=_flag),
+                    convert_options=pacsv.ConvertOptions(
+                        column_types={c: pa.string() for c in header},
+                        strings_can_be_null=False,
+                        quoted_strings_can_be_null=False,
+                    ),
+                )
+            except pa.ArrowInvalid:
+                table = None
+            # short or long rows: let pandas pad, skip or reject them
+            if table is not None and not bad_rows:
+                return table.to_pandas()
+    # cells as-is ("" stays ""); no fallback to the python engine
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_filter=False, engine="c",
+                       on_bad_lines="skip" if skip_bad else "error")
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_students_cached(sig: tuple) -> pd.DataFrame:
+    df = _read_csv_str(STUDENT_CSV)
     df.columns = df.columns.str.strip()
     df = df.rename(columns={"Boy / Girl":"Gender","First Name":"Name","Last Name":"Surname","Student Code":"Code","ID":"Code"})
 
@@ -305,56 +582,148 @@ def load_students() -> pd.DataFrame:
         if c not in df.columns:
             df[c] = ""
 
-    for c in df.columns:
-        df[c] = df[c].astype(str).str.strip()
+    # Clean strings
+    df = df.apply(lambda s: s.str.strip())
 
-    df["_CODE_CANON"] = df["Code"].map(_canon)
+    df["_CODE_CANON"] = _canon_series(df["Code"])
+    # "Name Surname" as shown in pickers and labels
+    df["_DISPLAY_NAME"] = df["Name"].str.cat(df["Surname"], sep=" ").str.strip()
     df = df.loc[:, ~df.columns.str.match(r"^Unnamed")]
     return df
 
-def load_books() -> pd.DataFrame:
-    raw = pd.read_csv(BOOKS_CSV, dtype=str, on_bad_lines="skip").fillna("")
-    return _apply_book_helpers(raw)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_books_cached(sig: tuple) -> pd.DataFrame:
+    raw = _read_csv_str(BOOKS_CSV, skip_bad=True)
+    df = _apply_book_helpers(raw)
+    # Status as a categorical, plus a bool mask for filters
+    df["Status"] = pd.Categorical(df["Status"], categories=["Available", "Borrowed"])
+    df["_AVAILABLE"] = (df["Status"] == "Available").to_numpy()
+    # lowered title/author/ID/barcode for the catalog search
+    df["_SEARCH"] = (
+        df.get("Book Title", "") + "\x1f" + df.get("Author", "") + "\x1f" + df.get("Book ID", "") + "\x1f" + df["Barcode"]
+    ).str.lower()
+    return df
 
-def load_logs() -> pd.DataFrame:
-    df = pd.read_csv(LOG_CSV, dtype=str, on_bad_lines="skip").fillna("")
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_logs_cached(sig: tuple) -> pd.DataFrame:
+    df = _read_csv_str(LOG_CSV, skip_bad=True)
     df.columns = df.columns.str.strip()
 
-    rename_map = {
-        "Book Tittle": "Book Title",
-        "Book Title ": "Book Title",
-        "Date Due": "Due Date",
-        "Borrow Date": "Date Borrowed",
-        "Borrowed Date": "Date Borrowed",
-        "Return": "Returned",
-        "Is Returned": "Returned",
-        "Barcode/ISBN": "Barcode",
-        "ISBN": "Barcode",
-        "CopyKey": "Copy Key",
-        "CopyKey ": "Copy Key",
-    }
-    df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
-    df = df.loc[:, ~df.columns.duplicated()].copy()
-
-    for c in ["Student","Book Title","Book ID","Date Borrowed","Due Date","Returned","Barcode","Copy Key"]:
-        if c not in df.columns:
-            df[c] = ""
+    # legacy or hand-edited headers
+    if df.columns.tolist() != LOG_COLS:
+        rename_map = {
+            "Book Tittle": "Book Title",
+            "Book Title ": "Book Title",
+            "Date Due": "Due Date",
+            "Borrow Date": "Date Borrowed",
+            "Borrowed Date": "Date Borrowed",
+            "Return": "Returned",
+            "Is Returned": "Returned",
+            "Barcode/ISBN": "Barcode",
+            "ISBN": "Barcode",
+            "CopyKey": "Copy Key",
+            "CopyKey ": "Copy Key",
+        }
+        df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
+        df = df.loc[:, ~df.columns.duplicated()]
 
-    for c in df.columns:
-        df[c] = df[c].astype(str).str.strip()
+        for c in ["Student","Book Title","Book ID","Date Borrowed","Due Date","Returned","Barcode","Copy Key"]:
+            if c not in df.columns:
+                df[c] = ""
 
-    df["Returned"] = df["Returned"].str.lower().map(
-        {"yes":"Yes","y":"Yes","true":"Yes","1":"Yes","no":"No","n":"No","false":"No","0":"No"}
-    ).fillna("No")
+    # Clean strings
+    df = df.apply(lambda s: s.str.strip())
+
+    # Yes/No categorical
+    df["Returned"] = pd.Categorical(
+        df["Returned"].str.lower().map(
+            {"yes":"Yes","y":"Yes","true":"Yes","1":"Yes","no":"No","n":"No","false":"No","0":"No"}
+        ).fillna("No"),
+        categories=["No", "Yes"],
+    )
 
+    # remove empty rows
     key_cols = ["Student","Book Title","Book ID","Barcode","Copy Key"]
-    mask_all_blank = df[key_cols].apply(lambda s: s.astype(str).str.strip() == "").all(axis=1)
+    mask_all_blank = (df[key_cols] == "").all(axis=1)
     df = df[~mask_all_blank].reset_index(drop=True)
+
+    df["_OPEN"] = (df["Returned"] == "No").to_numpy()
+    df["_BARCODE_CANON"] = _canon_series(df["Barcode"])
+
+    # parsed timestamps; the string columns stay as written
+    df["_DUE"] = _parse_ts(df["Due Date"])
+    df["_BORROWED"] = _parse_ts(df["Date Borrowed"])
     return df
 
+def _file_sig(path: str) -> tuple:
+    """(mtime_ns, size): catches rewrites that land inside one coarse mtime tick."""
+    info = os.stat(path)
+    return info.st_mtime_ns, info.st_size
+
+def load_students() -> pd.DataFrame:
+    return _load_students_cached(_file_sig(STUDENT_CSV)).copy(deep=False)
+
+def load_books() -> pd.DataFrame:
+    return _load_books_cached(_file_sig(BOOKS_CSV)).copy(deep=False)
+
+def load_logs() -> pd.DataFrame:
+    return _load_logs_cached(_file_sig(LOG_CSV)).copy(deep=False)
+
+def _clear_load_cache(path: str):
+    {STUDENT_CSV: _load_students_cached, BOOKS_CSV: _load_books_cached, LOG_CSV: _load_logs_cached}[path].clear()
+
+_held_locks = threading.local()
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive advisory lock for writers of path (sessions are threads; flock also covers other processes).
+
+    Re-entrant within a thread, so a caller can hold it across load_* -> change -> save_*.
+    The lock lives on a sidecar file because _write_csv swaps the CSV's inode out from under a lock on it.
+    """
+    held = _held_locks.__dict__.setdefault("paths", set())
+    if fcntl is None or path in held:
+        yield
+        return
+    with open(path + ".lock", "a") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+def _write_csv(df: pd.DataFrame, path: str) -> bool:
+    """Write to a temp file beside path, then swap it in: readers never see a half-written CSV.
+
+    Returns False without writing when the file already holds exactly these bytes.
+    """
+    data = df.to_csv(index=False).encode("utf-8")
+    with _file_lock(path):
+        try:
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+        except FileNotFoundError:
+            pass
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            if os.path.exists(path):
+                os.chmod(tmp, os.stat(path).st_mode & 0o777)  # mkstemp creates 0600
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return True
+
 def save_students(df: pd.DataFrame):
-    out = df.drop(columns=["_CODE_CANON"], errors="ignore").copy()
-    out.to_csv(STUDENT_CSV, index=False, encoding="utf-8")
+    out = df.drop(columns=["_CODE_CANON", "_DISPLAY_NAME"], errors="ignore").copy()
+    if not _write_csv(out, STUDENT_CSV):
+        return  # unchanged: no cache bust, no GitHub commit
+    _clear_load_cache(STUDENT_CSV)
     if _gh_enabled():
         try:
             _gh_put_csv(STUDENT_CSV, "Student_records.csv", "Update Student_records.csv via Streamlit app")
@@ -362,8 +731,10 @@ def save_students(df: pd.DataFrame):
             st.error(f"GitHub sync failed: {e}")
 
 def save_books(df: pd.DataFrame):
-    out = _apply_book_helpers(df)
-    out.to_csv(BOOKS_CSV, index=False, encoding="utf-8")
+    out = _apply_book_helpers(df.drop(columns=["_AVAILABLE", "_SEARCH"], errors="ignore"))
+    if not _write_csv(out, BOOKS_CSV):
+        return  # unchanged: no cache bust, no GitHub commit
+    _clear_load_cache(BOOKS_CSV)
     if _gh_enabled():
         try:
             _gh_put_csv(BOOKS_CSV, "Library_books.csv", "Update Library_books.csv via Streamlit app")
@@ -371,103 +742,240 @@ def save_books(df: pd.DataFrame):
             st.error(f"GitHub sync failed: {e}")
 
 def save_logs(df: pd.DataFrame):
-    cols = ["Student", "Book Title", "Book ID", "Barcode", "Copy Key", "Date Borrowed", "Due Date", "Returned"]
+    cols = LOG_COLS
     out = df.copy()
     for c in cols:
         if c not in out.columns:
             out[c] = ""
     out = out[cols]
-    out.to_csv(LOG_CSV, index=False, encoding="utf-8")
+    if not _write_csv(out, LOG_CSV):
+        return  # unchanged: no cache bust, no GitHub commit
+    _clear_load_cache(LOG_CSV)
     if _gh_enabled():
         try:
             _gh_put_csv(LOG_CSV, "Borrow_log.csv", "Update Borrow_log.csv via Streamlit app")
         except Exception as e:
             st.error(f"GitHub sync failed: {e}")
 
+def append_rows(path: str, rows: list) -> bool:
+    """Append records to an existing CSV in place.
+
+    Returns False (and writes nothing) when the on-disk header cannot hold the rows,
+    so the caller can fall back to a full save.
+    """
+    # locked from the header check to the last byte
+    with _file_lock(path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            header = [h.strip() for h in next(csv.reader(f), [])]
+        if not header or any(k not in header for row_dict in rows for k in row_dict):
+            return False
+
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b"\n", b"\r")
+
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            if needs_newline:
+                f.write(os.linesep)
+            csv.writer(f, lineterminator=os.linesep).writerows([row_dict.get(c, "") for c in header] for row_dict in rows)
+    _clear_load_cache(path)
+
+    if _gh_enabled():
+        name = os.path.basename(path)
+        try:
+            _gh_put_csv(path, name, f"Update {name} via Streamlit app")
+        except Exception as e:
+            st.error(f"GitHub sync failed: {e}")
+    return True
+
+def append_row(path: str, row_dict: dict) -> bool:
+    return append_rows(path, [row_dict])
+
+# ===============================
+# Cached view helpers
+# ===============================
+@st.cache_data(show_spinner=False)
+def _logo_html(path: str, sig: tuple) -> str:
+    """Centered logo <img> with the PNG inlined."""
+    with open(path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode()
+    return (
+        "<div style='text-align:center; margin-top:10px;'>"
+        f"<img src='data:image/png;base64,{encoded}' width='150'>"
+        "</div>"
+    )
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _summary_counts(books_sig: tuple, n_students: int) -> tuple:
+    """(students, books, available, borrowed) for the header metrics."""
+    books_df = _load_books_cached(books_sig)
+    counts = books_df["Status"].value_counts()
+    return n_students, len(books_df), int(counts.get("Available", 0)), int(counts.get("Borrowed", 0))
+
+# Lookup dicts keyed on the file signature, like the loaders
+@st.cache_data(show_spinner=False, max_entries=4)
+def _copy_index(books_sig: tuple) -> dict:
+    """_COPY_KEY -> row label of that copy in the catalog."""
+    books_df = _load_books_cached(books_sig)
+    return dict(zip(books_df["_COPY_KEY"], books_df.index))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _code_index(students_sig: tuple) -> dict:
+    """_CODE_CANON -> row label of the first learner with that code, for the scanner box."""
+    codes = _load_students_cached(students_sig)["_CODE_CANON"]
+    keep = ~codes.duplicated()
+    return dict(zip(codes[keep], codes.index[keep]))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _barcode_index(books_sig: tuple) -> dict:
+    """_BARCODE_CANON -> row label of the first available copy with that barcode, for the scanner box."""
+    books_df = _load_books_cached(books_sig)
+    avail = books_df.loc[books_df["_AVAILABLE"] & (books_df["_BARCODE_CANON"] != ""), "_BARCODE_CANON"]
+    keep = ~avail.duplicated()
+    return dict(zip(avail[keep], avail.index[keep]))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _open_barcode_index(logs_sig: tuple) -> dict:
+    """_BARCODE_CANON -> row label of the first open log with that barcode, for the return scanner."""
+    logs_df = _load_logs_cached(logs_sig)
+    bars = logs_df.loc[logs_df["_OPEN"] & (logs_df["_BARCODE_CANON"] != ""), "_BARCODE_CANON"]
+    keep = ~bars.duplicated()
+    return dict(zip(bars[keep], bars.index[keep]))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _missing_log_keys(books_sig: tuple, logs_sig: tuple) -> list:
+    """Sorted Copy Keys that are Borrowed in the catalog but have no open log."""
+    books_df = _load_books_cached(books_sig)
+    logs_df = _load_logs_cached(logs_sig)
+    # sorted unique keys
+    borrowed = pd.Index(books_df.loc[~books_df["_AVAILABLE"], "_COPY_KEY"].unique())
+    return borrowed.difference(logs_df.loc[logs_df["_OPEN"], "Copy Key"]).tolist()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _student_display_names(students_sig: tuple) -> list:
+    """Sorted, de-duplicated "Name Surname" list for the student pickers."""
+    names = _load_students_cached(students_sig)["_DISPLAY_NAME"]
+    return names[names.ne("")].drop_duplicates().sort_values().tolist()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _copy_options(books_sig: tuple, only_available: bool = False) -> dict:
+    """Map each copy's dropdown label -> _COPY_KEY (first copy wins on identical labels)."""
+    df = _load_books_cached(books_sig)
+    if only_available:
+        df = df[df["_AVAILABLE"]]
+    labels = (
+        df["Book Title"].astype(str)
+        + "  [ID:" + df.get("Book ID", pd.Series("", index=df.index)).astype(str).replace("", "-", regex=False)
+        + " | BC:" + df.get("Barcode", pd.Series("", index=df.index)).astype(str).replace("", "-", regex=False) + "]"
+    )
+    keep = ~labels.duplicated()
+    return dict(zip(labels[keep], df.loc[keep, "_COPY_KEY"]))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _analytics(logs_sig: tuple) -> tuple:
+    """Top-5 titles, distinct borrower count and monthly borrow trend for the Analytics tab."""
+    logs_df = _load_logs_cached(logs_sig)
+    top_books = logs_df["Book Title"].value_counts().nlargest(5).reset_index()
+    top_books.columns = ["Book Title", "Borrow Count"]
+
+    active_count = int(logs_df["Student"].nunique())
+
+    borrowed_at = logs_df["_BORROWED"].dropna().rename("Date Borrowed")
+    trend = borrowed_at.groupby(borrowed_at.dt.to_period("M")).size().reset_index(name="Borrows")
+    trend["Month"] = trend["Date Borrowed"].astype(str)
+    return top_books, active_count, trend
+
+# Plotly figures, rebuilt only when the aggregates change
+@st.cache_data(show_spinner=False)
+def _fig_top_books(top_books: pd.DataFrame):
+    return px.bar(top_books, x="Book Title", y="Borrow Count", title="📚 Top 5 Most Borrowed Books")
+
+@st.cache_data(show_spinner=False)
+def _fig_active_students(active_count: int, inactive_count: int):
+    pie_df = pd.DataFrame({"Status": ["Active", "Inactive"], "Count": [active_count, inactive_count]})
+    return px.pie(pie_df, values="Count", names="Status", title="👩‍🎓 Active vs Inactive Students")
+
+@st.cache_data(show_spinner=False)
+def _fig_trend(trend: pd.DataFrame):
+    return px.line(trend, x="Month", y="Borrows", title="📈 Borrowing Trends Over Time")
+
 # ===============================
 # Catalog ↔ Log smart sync
 # ===============================
 def sync_missing_open_logs(books_df: pd.DataFrame, logs_df: pd.DataFrame):
+    """Returns (patched logs, new open-log rows, created keys, patched keys); the new rows are not concatenated."""
     books_borrowed = books_df.loc[
-        books_df["Status"].str.lower()=="borrowed",
+        ~books_df["_AVAILABLE"],
         ["Book Title","Book ID","Barcode","_COPY_KEY"]
-    ].copy()
+    ]
 
-    open_logs = logs_df[logs_df["Returned"].str.lower()=="no"].copy()
-    open_keys = set(open_logs["Copy Key"].astype(str).str.strip())
-
-    to_fix = books_borrowed[~books_borrowed["_COPY_KEY"].isin(open_keys)]
+    open_logs = logs_df[logs_df["_OPEN"]]
+    new = pd.DataFrame(columns=LOG_COLS)
+    to_fix = books_borrowed[~books_borrowed["_COPY_KEY"].isin(open_logs["Copy Key"])]
     if to_fix.empty:
-        return logs_df, [], []
+        return logs_df, new, [], []
 
-    created, patched = [], []
     now = datetime.now()
     due = now + timedelta(days=14)
-    logs_new = logs_df.copy()
-
-    for _, r in to_fix.iterrows():
-        key = r["_COPY_KEY"]
-        bid = r.get("Book ID","")
-        bc  = r.get("Barcode","")
-
-        patch_mask = (
-            (logs_new["Returned"].str.lower()=="no")
-            & (logs_new["Copy Key"].astype(str).str.strip() == "")
-            & (logs_new["Book ID"].astype(str).str.strip() == str(bid).strip())
-            & (logs_new["Barcode"].astype(str).str.strip() == str(bc).strip())
-        )
-        if patch_mask.any():
-            logs_new.loc[patch_mask, "Copy Key"] = key
-            patched.append(key)
-            continue
-
-        new_row = {
+    logs_new = logs_df.copy(deep=False)
+
+    # Open log rows without a Copy Key get patched by the first borrowed copy with the same
+    # (Book ID, Barcode); every other borrowed copy gets a new open row. Joined on a pair key.
+    def _pair(df):
+        return df["Book ID"] + "\x1f" + df["Barcode"]
+
+    orphan = logs_new["_OPEN"] & (logs_new["Copy Key"] == "")
+    orphan_pairs = _pair(logs_new[orphan])
+    fix_pairs = _pair(to_fix)
+    patch = ~fix_pairs.duplicated() & fix_pairs.isin(orphan_pairs)
+
+    pair_to_key = dict(zip(fix_pairs[patch], to_fix.loc[patch, "_COPY_KEY"]))
+    new_keys = orphan_pairs.map(pair_to_key).dropna()
+    logs_new.loc[new_keys.index, "Copy Key"] = new_keys
+    patched = to_fix.loc[patch, "_COPY_KEY"].tolist()
+
+    to_create = to_fix[~patch]
+    created = to_create["_COPY_KEY"].tolist()
+    if created:
+        # appended by the caller
+        new = pd.DataFrame({
             "Student": "",
-            "Book Title": r.get("Book Title",""),
-            "Book ID": bid,
-            "Barcode": bc,
-            "Copy Key": key,
-            "Date Borrowed": now.strftime("%Y-%m-%d %H:%M:%S"),
-            "Due Date": due.strftime("%Y-%m-%d %H:%M:%S"),
+            "Book Title": to_create["Book Title"].to_numpy(),
+            "Book ID": to_create["Book ID"].to_numpy(),
+            "Barcode": to_create["Barcode"].to_numpy(),
+            "Copy Key": created,
+            "Date Borrowed": now.strftime(TS_FMT),
+            "Due Date": due.strftime(TS_FMT),
             "Returned": "No",
-        }
-        logs_new = df_append(logs_new, new_row)
-        created.append(key)
-
-    return logs_new, created, patched
+        })
+    return logs_new, new, created, patched
 
 # ===============================
 # Learners Tab (Editable + Add + Delete)
 # ===============================
 def learners_tab():
     st.subheader("👩‍🎓 Learners (Students)")
-    students = load_students().copy()
-
-    # Ensure columns exist
-    for c in ["Code", "Name", "Surname", "Gender"]:
-        if c not in students.columns:
-            students[c] = ""
-
-    # Clean strings
-    for c in ["Code", "Name", "Surname", "Gender"]:
-        students[c] = students[c].astype(str).str.strip()
+    students = load_students()
 
+    # load_students guarantees Code/Name/Surname/Gender as stripped str columns
     can_edit = is_admin()
 
     # Canonical code column (for uniqueness checks, matching, etc.)
-    students["_CODE_CANON"] = students["Code"].astype(str).str.strip().str.lower()
+    students["_CODE_CANON"] = students["Code"].str.lower()
 
     # -------------------------------
     # Non-admin view only
     # -------------------------------
     q = st.text_input("Search (Code / Name / Surname)", "").strip().lower()
-    view = students.copy()
+    view = students
     if q:
         view = view[
-            view["Code"].astype(str).str.lower().str.contains(q, na=False) |
-            view["Name"].astype(str).str.lower().str.contains(q, na=False) |
-            view["Surname"].astype(str).str.lower().str.contains(q, na=False)
-        ].copy()
+            view["Code"].str.contains(q, case=False, regex=False) |
+            view["Name"].str.contains(q, case=False, regex=False) |
+            view["Surname"].str.contains(q, case=False, regex=False)
+        ]
 
     view = view.sort_values(["Code", "Name", "Surname"], kind="stable")
     view["_row_id"] = view.index
@@ -500,47 +1008,54 @@ def learners_tab():
                     st.error("Code, Name, Surname cannot be blank.")
                 else:
                     canon = new_code.strip().lower()
-                    if canon in set(students["_CODE_CANON"].tolist()):
+                    # checked and written under one lock, against the file as it is now
+                    with _file_lock(STUDENT_CSV):
+                        students = load_students()
+                        exists = (students["_CODE_CANON"] == canon).any()
+                        if not exists:
+                            # Append new row
+                            new_row = {
+                                "Code": new_code.strip(),
+                                "Name": new_name.strip(),
+                                "Surname": new_surname.strip(),
+                                "Gender": new_gender.strip()
+                            }
+                            if not append_row(STUDENT_CSV, new_row):
+                                students = students.drop(columns=["_CODE_CANON"], errors="ignore")
+                                save_students(df_append(students, new_row))
+                    if exists:
                         st.error("This Code already exists. Codes must be unique.")
                     else:
-                        # Append new row
-                        new_row = {
-                            "Code": new_code.strip(),
-                            "Name": new_name.strip(),
-                            "Surname": new_surname.strip(),
-                            "Gender": new_gender.strip()
-                        }
-                        students = students.drop(columns=["_CODE_CANON"], errors="ignore")
-                        students = pd.concat([students, pd.DataFrame([new_row])], ignore_index=True)
-                        save_students(students)
                         st.success("Learner added ✅")
                         st.rerun()
 
     with st.expander("🗑️ Delete learner", expanded=False):
-        # Build a nice label list
-        students_for_delete = students.copy()
-        students_for_delete["Label"] = (
-            students_for_delete["Code"].astype(str).str.strip()
-            + " — " + students_for_delete["Name"].astype(str).str.strip()
-            + " " + students_for_delete["Surname"].astype(str).str.strip()
-        )
+        # Label -> row label; repeated labels (blank or shared Codes) get their row number
+        labels = students["Code"] + " — " + students["_DISPLAY_NAME"]
+        dup = labels.duplicated(keep=False)
+        labels = labels.where(~dup, labels + " (row " + (labels.index + 1).astype(str) + ")")
+        delete_options = dict(zip(labels, students.index))
 
-        labels = students_for_delete["Label"].tolist()
-        if not labels:
+        if not delete_options:
             st.info("No learners to delete.")
         else:
-            selected_label = st.selectbox("Select learner to delete", labels)
+            selected_label = st.selectbox("Select learner to delete", list(delete_options))
             if st.button("❌ Delete selected learner", type="primary"):
-                # Locate row by label (unique if Code unique)
-                row_to_delete = students_for_delete[students_for_delete["Label"] == selected_label].index
-                if len(row_to_delete) == 0:
+                row = delete_options.get(selected_label)
+                if row is None:
                     st.error("Could not find the selected learner.")
                 else:
-                    students = students.drop(index=row_to_delete).reset_index(drop=True)
-                    students = students.drop(columns=["_CODE_CANON"], errors="ignore")
-                    save_students(students)
-                    st.success("Learner deleted ✅")
-                    st.rerun()
+                    key_cols = ["Code", "Name", "Surname", "Gender"]
+                    with _file_lock(STUDENT_CSV):
+                        latest = load_students()
+                        hit = _match_rows(latest, students.loc[[row]], key_cols)
+                        if not hit.empty:
+                            save_students(latest.drop(index=hit.to_numpy()).reset_index(drop=True))
+                    if hit.empty:
+                        st.error("This learner was changed or removed in another session; nothing was deleted.")
+                    else:
+                        st.success("Learner deleted ✅")
+                        st.rerun()
 
     st.divider()
 
@@ -548,20 +1063,16 @@ def learners_tab():
     # Admin table editor (existing)
     # -------------------------------
     # Refresh view after possible changes
-    students = load_students().copy()
-    for c in ["Code", "Name", "Surname", "Gender"]:
-        if c not in students.columns:
-            students[c] = ""
-        students[c] = students[c].astype(str).str.strip()
+    students = load_students()
 
     q2 = st.text_input("Search (Code / Name / Surname) ", "", key="q_learners_2").strip().lower()
-    view2 = students.copy()
+    view2 = students
     if q2:
         view2 = view2[
-            view2["Code"].astype(str).str.lower().str.contains(q2, na=False) |
-            view2["Name"].astype(str).str.lower().str.contains(q2, na=False) |
-            view2["Surname"].astype(str).str.lower().str.contains(q2, na=False)
-        ].copy()
+            view2["Code"].str.contains(q2, case=False, regex=False) |
+            view2["Name"].str.contains(q2, case=False, regex=False) |
+            view2["Surname"].str.contains(q2, case=False, regex=False)
+        ]
 
     view2 = view2.sort_values(["Code", "Name", "Surname"], kind="stable")
     view2["_row_id"] = view2.index
@@ -582,8 +1093,8 @@ def learners_tab():
 
     if st.button("💾 Save changes", key="btn_save_learners"):
         edited = edited.copy()
-        for c in ["Code", "Name", "Surname", "Gender"]:
-            edited[c] = edited[c].astype(str).str.strip()
+        cols = ["Code", "Name", "Surname", "Gender"]
+        edited[cols] = edited[cols].astype(str).apply(lambda s: s.str.strip())
 
         if (edited["Code"] == "").any() or (edited["Name"] == "").any() or (edited["Surname"] == "").any():
             st.error("Code, Name, Surname cannot be blank.")
@@ -594,17 +1105,20 @@ def learners_tab():
             st.error("Duplicate student codes found. Codes must be unique.")
             return
 
-        # Apply edits back to original students by _row_id
-        for _, r in edited.iterrows():
-            rid = int(r["_row_id"])
-            students.loc[rid, "Code"] = r["Code"]
-            students.loc[rid, "Name"] = r["Name"]
-            students.loc[rid, "Surname"] = r["Surname"]
-            students.loc[rid, "Gender"] = r["Gender"]
-
-        save_students(students)
-        st.success("Learners updated successfully ✅")
-        st.rerun()
+        # Apply edits back to original students by _row_id: only changed rows, merged into the file as it is now
+        before = students.loc[edited["_row_id"].astype(int).to_numpy(), cols]
+        changed = (before.to_numpy() != edited[cols].to_numpy()).any(axis=1)
+        before, after = before[changed], edited.loc[changed, cols]
+        with _file_lock(STUDENT_CSV):
+            latest = load_students()
+            hit = _match_rows(latest, before, cols)
+            latest.loc[hit.to_numpy(), cols] = after.set_axis(before.index).loc[hit.index].to_numpy()
+            save_students(latest)
+        if len(hit) < len(before):
+            st.warning(f"{len(before) - len(hit)} learner(s) were changed in another session; their edits were not saved.")
+        else:
+            st.success("Learners updated successfully ✅")
+            st.rerun()
 
 
 # ===============================
@@ -612,6 +1126,7 @@ def learners_tab():
 # ===============================
 def main():
     ensure_files()
+    _gh_report_pending()
 
     students = load_students()
     books = load_books()
@@ -632,8 +1147,13 @@ def main():
         st.caption(f"Books rows: **{len(books)}**")
         st.caption(f"Logs rows: **{len(logs)}**")
 
+        if st.button("🔄 Recheck GitHub"):
+            _gh_self_test.clear()
         status, color = _gh_self_test()
         st.markdown(f"**GitHub:** <span style='color:{color}'>{status}</span>", unsafe_allow_html=True)
+        if _gh_enabled():
+            polling = GH_POLL_EVERY if st.session_state.get("gh_pending") else None
+            st.fragment(_gh_sync_status, run_every=polling)()
 
         with st.expander("Paths"):
             st.caption(f"Students: {STUDENT_CSV}")
@@ -643,39 +1163,33 @@ def main():
     # Logo
     logo_path = os.path.join(ASSETS_DIR, "chi-logo.png")
     if os.path.exists(logo_path):
-        with open(logo_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode()
-        st.markdown(
-            "<div style='text-align:center; margin-top:10px;'>"
-            f"<img src='data:image/png;base64,{encoded}' width='150'>"
-            "</div>", unsafe_allow_html=True
-        )
+        st.markdown(_logo_html(logo_path, _file_sig(logo_path)), unsafe_allow_html=True)
 
     st.markdown("<h1 style='text-align:center;'>📚 Tzu Chi Foundation — Tutor Class Library System</h1>", unsafe_allow_html=True)
 
     # Metrics
-    total_books     = len(books)
-    available_count = int((books["Status"].str.lower() == "available").sum()) if not books.empty else 0
-    borrowed_count  = int((books["Status"].str.lower() == "borrowed").sum()) if not books.empty else 0
+    n_students, total_books, available_count, borrowed_count = _summary_counts(_file_sig(BOOKS_CSV), len(students))
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Students", len(students))
+    c1.metric("Students", n_students)
     c2.metric("Books", int(total_books))
     c3.metric("Available", available_count)
     c4.metric("Borrowed (open)", borrowed_count)
 
     # Health check & quick sync
-    logged_open_keys = set(logs.loc[logs["Returned"].str.lower()=="no","Copy Key"].astype(str).str.strip()) if not logs.empty else set()
-    borrowed_copies  = set(books.loc[books["Status"].str.lower()=="borrowed","_COPY_KEY"].astype(str).str.strip()) if not books.empty else set()
-    missing_log_keys = sorted(borrowed_copies - logged_open_keys)
+    missing_log_keys = _missing_log_keys(_file_sig(BOOKS_CSV), _file_sig(LOG_CSV))
 
     with st.expander("⚠️ Status health check"):
         if missing_log_keys:
             st.warning("Copies **Borrowed** in Catalog but no open log (by Copy Key):")
             st.write(missing_log_keys[:50])
         if st.button("🔗 Create open logs for borrowed copies (quick sync)"):
-            logs_new, created, patched = sync_missing_open_logs(books, logs)
+            with _file_lock(LOG_CSV):
+                logs_new, new_rows, created, patched = sync_missing_open_logs(load_books(), load_logs())
+                if created or patched:
+                    # creations only: append to the log
+                    if patched or not append_rows(LOG_CSV, new_rows.to_dict("records")):
+                        save_logs(pd.concat([logs_new, new_rows], ignore_index=True))
             if created or patched:
-                save_logs(logs_new)
                 st.success(f"Patched {len(patched)} log(s); created {len(created)} new log(s).")
                 st.rerun()
             else:
@@ -695,9 +1209,10 @@ def main():
 
         selected_student = ""
         if scan_student_code:
-            hit = students.loc[students["_CODE_CANON"] == _canon(scan_student_code)]
-            if not hit.empty:
-                selected_student = (hit.iloc[0]["Name"] + " " + hit.iloc[0]["Surname"]).strip()
+            hit_idx = _code_index(_file_sig(STUDENT_CSV)).get(_canon(scan_student_code))
+            if hit_idx is not None:
+                hit = students.loc[hit_idx]
+                selected_student = hit["_DISPLAY_NAME"]
                 st.success(f"Student found: {selected_student}")
             else:
                 st.error("Student code not found.")
@@ -705,9 +1220,9 @@ def main():
         selected_copy_key = ""
         if scan_book_barcode:
             canon_bar = _canon(scan_book_barcode)
-            cand = books[(books["_BARCODE_CANON"] == canon_bar) & (books["Status"].str.lower()=="available")]
-            if not cand.empty:
-                r = cand.iloc[0]
+            book_idx = _barcode_index(_file_sig(BOOKS_CSV)).get(canon_bar)
+            if book_idx is not None:
+                r = books.loc[book_idx]
                 selected_copy_key = r["_COPY_KEY"]
                 st.success(f"Book found: {r['Book Title']} (ID:{r.get('Book ID','') or '-'})")
             else:
@@ -715,25 +1230,19 @@ def main():
 
         st.markdown("---")
 
-        student_names = (students["Name"].fillna("").str.strip() + " " + students["Surname"].fillna("").str.strip()).str.strip()
-        student_names = sorted([s for s in student_names.tolist() if s])
+        student_names = _student_display_names(_file_sig(STUDENT_CSV))
         sel_student_dropdown = st.selectbox("👩‍🎓 Pick Student (optional if you scanned)", [""] + student_names, index=0)
 
-        avail = books[books["Status"].str.lower()=="available"].copy()
-        if avail.empty:
+        avail_options = _copy_options(_file_sig(BOOKS_CSV), only_available=True)
+        if not avail_options:
             st.info("No available copies right now.")
             sel_copy_label = ""
         else:
-            avail["_label"] = (
-                avail["Book Title"].astype(str)
-                + "  [ID:" + avail.get("Book ID","").astype(str).replace("", "-", regex=False)
-                + " | BC:" + avail.get("Barcode","").astype(str).replace("", "-", regex=False) + "]"
-            )
-            sel_copy_label = st.selectbox("📚 Pick Book Copy (optional if you scanned)", [""] + avail["_label"].tolist(), index=0)
+            sel_copy_label = st.selectbox("📚 Pick Book Copy (optional if you scanned)", [""] + list(avail_options), index=0)
 
         final_student = selected_student or sel_student_dropdown
-        if sel_copy_label and not avail.empty and sel_copy_label in avail["_label"].values:
-            selected_copy_key = avail.loc[avail["_label"] == sel_copy_label, "_COPY_KEY"].iloc[0]
+        if sel_copy_label and sel_copy_label in avail_options:
+            selected_copy_key = avail_options[sel_copy_label]
 
         days = st.slider("Borrow Days", 1, 30, 14)
 
@@ -742,22 +1251,23 @@ def main():
                 st.error("Please provide both a student and a book copy.")
             else:
                 logs_latest = load_logs()
-                has_open = logs_latest[(logs_latest["Student"] == final_student) & (logs_latest["Returned"].str.lower() == "no")]
+                has_open = logs_latest[(logs_latest["Student"] == final_student) & logs_latest["_OPEN"]]
                 if not has_open.empty:
                     st.error(f"🚫 {final_student} already has a book out. Return it first.")
                 else:
-                    row = books[books["_COPY_KEY"] == selected_copy_key]
-                    if row.empty:
+                    copy_idx = _copy_index(_file_sig(BOOKS_CSV)).get(selected_copy_key)
+                    if copy_idx is None:
                         st.error("Could not locate the selected copy in catalog.")
                         st.stop()
 
                     now = datetime.now()
                     due = now + timedelta(days=days)
 
-                    book_title = row.iloc[0]["Book Title"]
-                    book_id    = row.iloc[0].get("Book ID","")
-                    barcode    = row.iloc[0].get("Barcode","")
-                    copy_key   = row.iloc[0]["_COPY_KEY"]
+                    row = books.loc[copy_idx]
+                    book_title = row["Book Title"]
+                    book_id    = row.get("Book ID","")
+                    barcode    = row.get("Barcode","")
+                    copy_key   = row["_COPY_KEY"]
 
                     new_row = {
                         "Student": final_student,
@@ -765,15 +1275,22 @@ def main():
                         "Book ID": book_id,
                         "Barcode": barcode,
                         "Copy Key": copy_key,
-                        "Date Borrowed": now.strftime("%Y-%m-%d %H:%M:%S"),
-                        "Due Date": due.strftime("%Y-%m-%d %H:%M:%S"),
+                        "Date Borrowed": now.strftime(TS_FMT),
+                        "Due Date": due.strftime(TS_FMT),
                         "Returned": "No",
                     }
-                    logs_latest = df_append(logs_latest, new_row)
-                    save_logs(logs_latest)
-
-                    books.loc[books["_COPY_KEY"] == copy_key, "Status"] = "Borrowed"
-                    save_books(books)
+                    # log + catalog land on GitHub as one commit
+                    with _gh_batch():
+                        if not append_row(LOG_CSV, new_row):
+                            with _file_lock(LOG_CSV):
+                                save_logs(df_append(load_logs(), new_row))
+
+                        with _file_lock(BOOKS_CSV):
+                            books_latest = load_books()
+                            copy_idx = _copy_index(_file_sig(BOOKS_CSV)).get(copy_key)
+                            if copy_idx is not None:
+                                books_latest.at[copy_idx, "Status"] = "Borrowed"
+                                save_books(books_latest)
 
                     st.success(f"✅ Borrowed: “{book_title}” to {final_student}. Due on {due.date()}")
                     st.rerun()
@@ -783,53 +1300,60 @@ def main():
         st.subheader("Return a Book")
         logs_now = load_logs()
 
-        open_logs_view = logs_now[logs_now["Returned"].str.lower()=="no"].copy()
+        open_logs_view = logs_now[logs_now["_OPEN"]]
         if open_logs_view.empty:
             st.success("✅ No books currently out.")
         else:
             barcode_return = st.text_input("Scan/enter Book Barcode (optional)").strip()
 
-            hits = pd.DataFrame()
+            hit_idx = None
             if barcode_return:
-                canon_bar = _canon(barcode_return)
-                hits = open_logs_view[open_logs_view["Barcode"].map(_canon) == canon_bar]
-                if not hits.empty:
-                    st.success(f"Matched: {hits.iloc[0]['Book Title']}")
+                hit_idx = _open_barcode_index(_file_sig(LOG_CSV)).get(_canon(barcode_return))
+                if hit_idx is not None:
+                    st.success(f"Matched: {logs_now.at[hit_idx, 'Book Title']}")
 
-            open_logs_view["Label"] = open_logs_view["Student"] + " | " + open_logs_view["Book Title"] + " | " + open_logs_view["Date Borrowed"]
+            # Label -> logs_now row label; first log wins on identical labels
+            labels = open_logs_view["Student"] + " | " + open_logs_view["Book Title"] + " | " + open_logs_view["Date Borrowed"]
+            keep = ~labels.duplicated()
+            return_options = dict(zip(labels[keep], labels.index[keep]))
 
             default_idx = 0
-            if not hits.empty:
-                target = hits.iloc[0]["Label"]
-                if target in open_logs_view["Label"].tolist():
-                    default_idx = open_logs_view["Label"].tolist().index(target)
+            if hit_idx is not None:
+                default_idx = list(return_options).index(labels.at[hit_idx])
 
-            selected_return = st.selectbox("Choose to Return", open_logs_view["Label"], index=default_idx)
+            selected_return = st.selectbox("Choose to Return", list(return_options), index=default_idx)
 
             if st.button("📦 Mark as Returned"):
-                row = open_logs_view[open_logs_view["Label"] == selected_return].iloc[0]
-                mask = (
-                    (logs_now["Student"] == row["Student"]) &
-                    (logs_now["Book Title"] == row["Book Title"]) &
-                    (logs_now["Date Borrowed"] == row["Date Borrowed"])
-                )
-                logs_now.loc[mask, "Returned"] = "Yes"
-                save_logs(logs_now)
-
-                copy_key = row.get("Copy Key","")
-                if copy_key:
-                    books_now = load_books()
-                    books_now.loc[books_now["_COPY_KEY"] == copy_key, "Status"] = "Available"
-                    save_books(books_now)
-
-                st.success(f"Returned: {row['Book Title']} from {row['Student']}")
-                st.rerun()
+                row_idx = return_options[selected_return]
+                row = logs_now.loc[row_idx]
+                with _gh_batch():
+                    with _file_lock(LOG_CSV):
+                        logs_latest = load_logs()
+                        hit = _match_rows(logs_latest, logs_now.loc[[row_idx]], LOG_COLS)
+                        if not hit.empty:
+                            logs_latest.loc[hit.to_numpy(), "Returned"] = "Yes"
+                            save_logs(logs_latest)
+
+                    copy_key = row.get("Copy Key","")
+                    if copy_key and not hit.empty:
+                        with _file_lock(BOOKS_CSV):
+                            books_now = load_books()
+                            copy_idx = _copy_index(_file_sig(BOOKS_CSV)).get(copy_key)
+                            if copy_idx is not None:
+                                books_now.at[copy_idx, "Status"] = "Available"
+                                save_books(books_now)
+
+                if hit.empty:
+                    st.error("This loan was changed in another session; nothing was returned.")
+                else:
+                    st.success(f"Returned: {row['Book Title']} from {row['Student']}")
+                    st.rerun()
 
     # ---------------- Borrowed now ----------------
     with tabs[2]:
         st.subheader("📋 Borrowed now (not returned)")
         logs_live = load_logs()
-        open_df = logs_live[logs_live["Returned"].str.lower()=="no"].copy()
+        open_df = logs_live[logs_live["_OPEN"]].copy()
 
         if open_df.empty:
             st.success("✅ No books currently out.")
@@ -840,15 +1364,26 @@ def main():
                     open_df[c] = ""
 
             now_ = datetime.now()
-            open_df["Due Date"] = pd.to_datetime(open_df["Due Date"], errors="coerce")
-
-            def _style(row):
-                if pd.notna(row["Due Date"]) and row["Due Date"] < now_:
-                    return ['background-color:#ffefef'] * len(row)
-                return [''] * len(row)
-
-            st.dataframe(open_df[show_cols].style.apply(_style, axis=1), use_container_width=True)
-            st.download_button("⬇️ Download current borrowers (CSV)", open_df[show_cols].to_csv(index=False), "borrowed_now.csv", "text/csv")
+            # Overdue flag column
+            view = open_df[show_cols].assign(**{"Due Date": open_df["_DUE"], "Overdue": (open_df["_DUE"] < now_).to_numpy()})
+            n_overdue = int(view["Overdue"].sum())
+            if n_overdue:
+                st.caption(f"⏰ {n_overdue} overdue — sort by the Overdue column to list them first.")
+
+            st.dataframe(
+                view,
+                use_container_width=True,
+                column_config={
+                    "Due Date": st.column_config.DatetimeColumn("Due Date", format="YYYY-MM-DD HH:mm"),
+                    "Overdue": st.column_config.CheckboxColumn("Overdue", help="Past the due date"),
+                },
+            )
+            st.download_button(
+                "⬇️ Download current borrowers (CSV)",
+                lambda: open_df[show_cols].to_csv(index=False),
+                "borrowed_now.csv",
+                "text/csv",
+            )
 
     # ---------------- Learners ----------------
     with tabs[3]:
@@ -857,7 +1392,7 @@ def main():
     # ---------------- Catalog ----------------
     with tabs[4]:
         st.subheader("📘 Catalog — View & Edit Copies")
-        books_now = load_books().copy()
+        books_now = load_books()
 
         if books_now.empty:
             st.info("No books yet. Use Books Admin tab to add some.")
@@ -866,18 +1401,13 @@ def main():
             search = col_f1.text_input("🔍 Search by title/author/ID/barcode", "")
             only_available = col_f2.checkbox("Show only Available", value=False)
 
-            df = books_now.copy()
+            # shallow copy: the editor's _row_id must stay off books_now
+            df = books_now.copy(deep=False)
             if search.strip():
-                q = search.strip().lower()
-                df = df[
-                    df.get("Book Title", "").str.lower().str.contains(q, na=False)
-                    | df.get("Author", "").str.lower().str.contains(q, na=False)
-                    | df.get("Book ID", "").str.lower().str.contains(q, na=False)
-                    | df.get("Barcode", "").str.lower().str.contains(q, na=False)
-                ].copy()
+                df = df[df["_SEARCH"].str.contains(search.strip().lower(), regex=False)]
 
             if only_available:
-                df = df[df["Status"].str.lower().eq("available")].copy()
+                df = df[df["_AVAILABLE"]]
 
             for c in ["Book ID", "Book Title", "Author", "Status", "Barcode"]:
                 if c not in df.columns:
@@ -894,45 +1424,53 @@ def main():
             )
 
             if st.button("💾 Save changes", key="btn_save_catalog"):
-                updated = books_now.copy()
-
+                cols = ["Book ID", "Book Title", "Author", "Barcode", "Status"]
                 to_update = edited.dropna(subset=["_row_id"]).copy()
                 to_update["_row_id"] = to_update["_row_id"].astype(int)
+                to_update = to_update[to_update["_row_id"].isin(books_now.index)]
 
-                for _, r in to_update.iterrows():
-                    ridx = r["_row_id"]
-                    if ridx in updated.index:
-                        updated.loc[ridx, "Book ID"] = str(r.get("Book ID","")).strip()
-                        updated.loc[ridx, "Book Title"] = str(r.get("Book Title","")).strip()
-                        updated.loc[ridx, "Author"] = str(r.get("Author","")).strip()
-                        updated.loc[ridx, "Barcode"] = str(r.get("Barcode","")).strip()
-                        status = str(r.get("Status","")).strip().lower()
-                        updated.loc[ridx, "Status"] = "Borrowed" if status in {"borrowed","out","issued"} else "Available"
+                to_update[cols[:4]] = to_update[cols[:4]].fillna("").astype(str).apply(lambda s: s.str.strip())
+                status = to_update["Status"].astype(str).str.strip().str.lower()
+                to_update["Status"] = np.where(status.isin(["borrowed", "out", "issued"]), "Borrowed", "Available")
+                # only rows the user changed, keyed on _ROW_UID
+                before = books_now.loc[to_update["_row_id"].to_numpy(), cols].astype(str)
+                to_update = to_update[(before.to_numpy() != to_update[cols].to_numpy()).any(axis=1)]
+                uids = books_now.loc[to_update["_row_id"].to_numpy(), "_ROW_UID"].to_numpy()
 
+                # Clean added rows
                 new_rows = edited[edited["_row_id"].isna()]
-                if not new_rows.empty:
-                    try:
-                        current_max = pd.to_numeric(updated["_ROW_UID"], errors="coerce").max()
-                        if pd.isna(current_max): current_max = 0
-                    except Exception:
-                        current_max = 0
-
-                    for _, r in new_rows.iterrows():
-                        current_max += 1
-                        rec = {
-                            "Book ID": str(r.get("Book ID","")).strip(),
-                            "Book Title": str(r.get("Book Title","")).strip(),
-                            "Author": str(r.get("Author","")).strip(),
-                            "Barcode": str(r.get("Barcode","")).strip(),
-                            "Status": "Borrowed" if str(r.get("Status","")).strip().lower() in {"borrowed","out","issued"} else "Available",
-                            "_ROW_UID": str(int(current_max)),
-                        }
-                        if rec["Book Title"] or rec["Barcode"]:
-                            updated = pd.concat([updated, pd.DataFrame([rec])], ignore_index=True)
-
-                save_books(updated)
-                st.success("Catalog saved.")
-                st.rerun()
+                recs = new_rows[cols[:4]].astype(str).fillna("")
+                recs = recs.apply(lambda s: s.str.strip())
+                status = new_rows["Status"].astype(str).fillna("").str.strip().str.lower()
+                recs["Status"] = np.where(status.isin(["borrowed", "out", "issued"]), "Borrowed", "Available")
+                recs = recs[(recs["Book Title"] != "") | (recs["Barcode"] != "")]
+
+                # merged into the catalog as it is now, under its lock
+                with _file_lock(BOOKS_CSV):
+                    updated = load_books()
+                    uid_rows = updated["_ROW_UID"].drop_duplicates()
+                    row_of = pd.Series(uid_rows.index, index=uid_rows.to_numpy())
+                    found = pd.Index(uids).isin(row_of.index)
+                    # Apply edits by _ROW_UID
+                    updated.loc[row_of[uids[found]].to_numpy(), cols] = to_update.loc[found, cols].to_numpy()
+
+                    if not recs.empty:
+                        try:
+                            current_max = pd.to_numeric(updated["_ROW_UID"], errors="coerce").max()
+                            if pd.isna(current_max): current_max = 0
+                        except Exception:
+                            current_max = 0
+                        first = int(current_max) + 1
+                        recs["_ROW_UID"] = [str(v) for v in range(first, first + len(recs))]
+                        # Append new rows
+                        updated = pd.concat([updated, recs], ignore_index=True)
+
+                    save_books(updated)
+                if not found.all():
+                    st.warning(f"{(~found).sum()} copy(ies) were removed in another session; their edits were not saved.")
+                else:
+                    st.success("Catalog saved.")
+                    st.rerun()
 
     # ---------------- Logs ----------------
     with tabs[5]:
@@ -942,20 +1480,24 @@ def main():
             st.info("No logs yet.")
         else:
             now = datetime.now()
-            logs_now["Due Date"] = pd.to_datetime(logs_now["Due Date"], errors="coerce")
-            logs_now["Days Overdue"] = logs_now.apply(
-                lambda row: (now - row["Due Date"]).days
-                if str(row.get("Returned","No")).lower() == "no" and pd.notna(row["Due Date"]) and row["Due Date"] < now
-                else 0,
-                axis=1
-            )
+            overdue = logs_now["_OPEN"] & (logs_now["_DUE"] < now)
+            days_overdue = np.where(overdue, (now - logs_now["_DUE"]).dt.days, 0).astype(int)
+            logs_view = logs_now.assign(**{"Days Overdue": days_overdue})
 
             show_cols = ["Student","Book Title","Book ID","Barcode","Copy Key","Date Borrowed","Due Date","Returned","Days Overdue"]
-            for c in show_cols:
-                if c not in logs_now.columns:
-                    logs_now[c] = ""
-            st.dataframe(logs_now[show_cols], use_container_width=True)
-            st.download_button("Download CSV", logs_now.to_csv(index=False), file_name="Borrow_log.csv", mime="text/csv")
+            # parsed Due Date on screen; the CSV keeps the string
+            st.dataframe(
+                logs_view[show_cols].assign(**{"Due Date": logs_view["_DUE"]}),
+                use_container_width=True,
+                column_config={"Due Date": st.column_config.DatetimeColumn("Due Date", format="YYYY-MM-DD HH:mm")},
+            )
+            # serialized on click
+            st.download_button(
+                "Download CSV",
+                lambda: logs_view.loc[:, ~logs_view.columns.str.startswith("_")].to_csv(index=False),
+                file_name="Borrow_log.csv",
+                mime="text/csv",
+            )
 
     # ---------------- Analytics ----------------
     with tabs[6]:
@@ -964,36 +1506,28 @@ def main():
         if logs_a.empty:
             st.info("No data available yet to display analytics.")
         else:
-            if "Book Title" in logs_a.columns:
-                top_books = logs_a["Book Title"].value_counts().nlargest(5).reset_index()
-                top_books.columns = ["Book Title", "Borrow Count"]
-                st.plotly_chart(px.bar(top_books, x="Book Title", y="Borrow Count", title="📚 Top 5 Most Borrowed Books"))
+            top_books, active_count, trend = _analytics(_file_sig(LOG_CSV))
+            st.plotly_chart(_fig_top_books(top_books))
 
-            active_students = logs_a["Student"].value_counts() if "Student" in logs_a.columns else pd.Series(dtype=int)
-            active_count = int(active_students[active_students > 0].count())
-            inactive_count = max(0, len(load_students()) - active_count)
-            pie_df = pd.DataFrame({"Status": ["Active", "Inactive"], "Count": [active_count, inactive_count]})
-            st.plotly_chart(px.pie(pie_df, values="Count", names="Status", title="👩‍🎓 Active vs Inactive Students"))
+            inactive_count = max(0, len(students) - active_count)
+            st.plotly_chart(_fig_active_students(active_count, inactive_count))
 
             today = datetime.now()
-            logs_od = logs_a.copy()
-            logs_od["Due Date"] = pd.to_datetime(logs_od.get("Due Date",""), errors="coerce")
-            overdue = logs_od[(logs_od.get("Returned","No").str.lower() == "no") & (logs_od["Due Date"] < today)]
-            if not overdue.empty:
-                overdue = overdue.copy()
-                overdue["Days Overdue"] = (today - overdue["Due Date"]).dt.days
+            is_overdue = logs_a["_OPEN"] & (logs_a["_DUE"] < today)
+            if is_overdue.any():
+                due = logs_a.loc[is_overdue, "_DUE"]
+                overdue = logs_a.loc[is_overdue, ["Student","Book Title"]].assign(
+                    **{"Due Date": due, "Days Overdue": (today - due).dt.days}
+                )
                 st.warning(f"⏰ {len(overdue)} books overdue!")
-                st.dataframe(overdue[["Student","Book Title","Due Date","Days Overdue"]])
+                st.dataframe(
+                    overdue,
+                    column_config={"Due Date": st.column_config.DatetimeColumn("Due Date", format="YYYY-MM-DD HH:mm")},
+                )
             else:
                 st.success("✅ No overdue books!")
 
-            logs_trend = logs_a.copy()
-            logs_trend["Date Borrowed"] = pd.to_datetime(logs_trend.get("Date Borrowed",""), errors="coerce")
-            trend = logs_trend.dropna(subset=["Date Borrowed"]).groupby(
-                logs_trend["Date Borrowed"].dt.to_period("M")
-            ).size().reset_index(name="Borrows")
-            trend["Month"] = trend["Date Borrowed"].astype(str)
-            st.plotly_chart(px.line(trend, x="Month", y="Borrows", title="📈 Borrowing Trends Over Time"))
+            st.plotly_chart(_fig_trend(trend))
 
     # ---------------- Books Admin ----------------
     with tabs[7]:
@@ -1011,23 +1545,27 @@ def main():
                 if not (title.strip() or barcode.strip()):
                     st.error("Please enter at least a Book Title or a Barcode.")
                 else:
-                    books_now = load_books()
-                    try:
-                        current_max = pd.to_numeric(books_now["_ROW_UID"], errors="coerce").max()
-                        if pd.isna(current_max): current_max = 0
-                    except Exception:
-                        current_max = 0
-
-                    new = {
-                        "Book ID": (book_id or "").strip(),
-                        "Book Title": title.strip(),
-                        "Author": (author or "").strip(),
-                        "Status": "Available",
-                        "Barcode": (barcode or "").strip(),
-                        "_ROW_UID": str(int(current_max) + 1),
-                    }
-                    books_now = df_append(books_now, new)
-                    save_books(books_now)
+                    # the next _ROW_UID is taken and written under one lock
+                    with _file_lock(BOOKS_CSV):
+                        books_now = load_books()
+                        try:
+                            current_max = pd.to_numeric(books_now["_ROW_UID"], errors="coerce").max()
+                            if pd.isna(current_max): current_max = 0
+                        except Exception:
+                            current_max = 0
+
+                        new = {
+                            "Book ID": (book_id or "").strip(),
+                            "Book Title": title.strip(),
+                            "Author": (author or "").strip(),
+                            "Status": "Available",
+                            "Barcode": (barcode or "").strip(),
+                            "_ROW_UID": str(int(current_max) + 1),
+                        }
+                        # catalog helpers fill the canon/copy-key columns
+                        new = _apply_book_helpers(pd.DataFrame([new])).iloc[0].to_dict()
+                        if not append_row(BOOKS_CSV, new):
+                            save_books(df_append(books_now, new))
                     st.success("Book copy added.")
                     st.rerun()
 
@@ -1038,18 +1576,15 @@ def main():
             if books_now.empty:
                 st.info("No books available.")
             else:
-                books_now["_label"] = (
-                    books_now["Book Title"].astype(str)
-                    + "  [ID:" + books_now.get("Book ID","").astype(str).replace("", "-", regex=False)
-                    + " | BC:" + books_now.get("Barcode","").astype(str).replace("", "-", regex=False) + "]"
-                )
-                pick = st.selectbox("Select book copy to delete", [""] + books_now["_label"].tolist())
+                copy_options = _copy_options(_file_sig(BOOKS_CSV))
+                pick = st.selectbox("Select book copy to delete", [""] + list(copy_options))
                 confirm = st.checkbox("I confirm deletion (cannot undo)")
 
                 if st.button("Delete Book Copy", disabled=not (pick and confirm)):
-                    key = books_now.loc[books_now["_label"]==pick, "_COPY_KEY"].iloc[0]
-                    books_now = books_now[books_now["_COPY_KEY"] != key]
-                    save_books(books_now)
+                    key = copy_options[pick]
+                    with _file_lock(BOOKS_CSV):
+                        books_now = load_books()
+                        save_books(books_now[books_now["_COPY_KEY"] != key])
                     st.success("Book copy deleted.")
                     st.rerun()
 